@@ -1,14 +1,24 @@
 # app.py
 import base64
 import io
+import json
+import os
+import tempfile
+from functools import lru_cache
 from typing import Dict
 
+import numpy as np
 import pandas as pd
 import plotly.express as px
+import plotly.graph_objects as go
+import plotly.io as pio
+import pyarrow as pa
+import pyarrow.parquet as pq
 from wordcloud import WordCloud
 
 import dash
-from dash import dcc, html
+from dash import Input, Output, dcc, html
+from dash.exceptions import PreventUpdate
 
 # ---------------------------
 # Configs
@@ -20,6 +30,11 @@ EXTERNAL_STYLESHEETS = [
 
 N = 12 # top N / bottom N lugares a mostrar en el foco
 MIN_TOPIC_MENTIONS = 40  # umbral mín. para mostrar tópico en treemap
+SNAPSHOT_SIGNATURE_KEY = b"reviews_csv_signature"  # metadato Parquet con la firma del CSV de origen
+SENT_CATEGORIES = ["POS", "NEU", "NEG"]  # orden fijo -> códigos 0, 1, 2
+SENT_NAMES = ["Positivas", "Neutrales", "Negativas"]  # etiquetas para las gráficas
+WC_MAX_WORDS = 200  # palabras máximas en la nube
+REVIEW_COLUMN_ALIASES = frozenset({"review", "review_text", "review_lematizada", "review_lemmatized", "texto", "comentario"})
 PALETTE = px.colors.sequential.Viridis  # paleta única y agradable
 
 # ---------------------------
@@ -75,24 +90,18 @@ topic_descriptions: Dict[str, str] = {
 # ---------------------------
 # Utilidades
 # ---------------------------
-def short_label(topic_id: str, max_len: int = 70) -> str:
-    desc = topic_descriptions.get(topic_id, "")
-    if desc:
-        return f"Tópico {topic_id}"
-
-
 def detect_review_column(df: pd.DataFrame):
     # busca columnas que parezcan contener texto de reseñas
-    candidates = [c for c in df.columns if c.lower() in ("review", "review_text", "review_lematizada", "review_lemmatized", "texto", "comentario")]
-    if candidates:
-        return candidates[0]
+    hit = next((c for c in df.columns if c.lower() in REVIEW_COLUMN_ALIASES), None)
+    if hit:
+        return hit
     # fallback: la columna con mayor proporción de strings largos
     text_cols = [c for c in df.columns if df[c].dtype == "object" or pd.api.types.is_string_dtype(df[c])]
     best = None
     best_score = 0
     for c in text_cols:
         sample = df[c].dropna().astype(str).head(200)
-        avg_len = sample.map(len).mean() if not sample.empty else 0
+        avg_len = sample.str.len().mean() if not sample.empty else 0
         score = avg_len * (len(sample) / max(1, len(df)))
         if score > best_score:
             best_score = score
@@ -100,11 +109,49 @@ def detect_review_column(df: pd.DataFrame):
     return best
 
 
+def load_reviews(path: str) -> pd.DataFrame:
+    # usa un snapshot Parquet tipado junto al CSV; solo es válido si guarda la misma
+    # firma (mtime en ns + tamaño) del CSV actual, si no se regenera
+    pq_path = path + ".parquet"
+    st = os.stat(path)
+    signature = f"{st.st_mtime_ns}:{st.st_size}".encode()
+    if os.path.exists(pq_path):
+        try:
+            if (pq.read_schema(pq_path).metadata or {}).get(SNAPSHOT_SIGNATURE_KEY) == signature:
+                return pd.read_parquet(pq_path, engine="pyarrow")
+        except (OSError, ValueError):
+            pass  # snapshot corrupto, truncado o ilegible: se reconstruye desde el CSV
+    df = pd.read_csv(
+        path,
+        encoding="utf-8",
+        low_memory=False,
+        dtype={"Lugar": "category", "SentLabel": "category", "Topic": "string"},
+    )
+    table = pa.Table.from_pandas(df)
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}), SNAPSHOT_SIGNATURE_KEY: signature})
+    # se escribe a un temporal en el mismo directorio y se renombra: nunca queda un snapshot a medias
+    tmp_path = None
+    try:
+        fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(pq_path) + ".", suffix=".tmp", dir=os.path.dirname(os.path.abspath(pq_path)))
+        os.close(fd)
+        pq.write_table(table, tmp_path, compression="zstd")
+        # mkstemp crea el archivo con 0600: se aplican los permisos normales según la umask
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(tmp_path, 0o666 & ~umask)
+        os.replace(tmp_path, pq_path)
+    except OSError:
+        # p. ej. sistema de archivos de solo lectura o disco lleno: seguimos sin caché
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return df
+
+
 # ---------------------------
 # Cargar y preparar datos
 # ---------------------------
-df = pd.read_csv(CSV_PATH, encoding="utf-8", low_memory=False)
-df_copy = df.copy()
+df = load_reviews(CSV_PATH)
+total_reviews = len(df)  # antes de filtrar tópicos
 
 # normalizar nombres de columnas (tu mapa original)
 rename_map = {
@@ -124,19 +171,23 @@ if "lugar" not in df.columns or "sent_label" not in df.columns:
 # limpiar 'lugar'
 df["lugar"] = (
     df["lugar"]
-    .astype(str)
-    .str.replace(r"^reseñas_", "", regex=True)
-    .str.replace("_", " ")
+    .astype("string")
+    .str.removeprefix("reseñas_")
+    .str.replace("_", " ", regex=False)
     .str.strip()
 )
 
 # normalizar tópico
 if "topic" in df.columns:
-    df["topic"] = df["topic"].astype(str).str.strip()
-    df = df[~df["topic"].isin(["-1", "-1.0", "", "None", "nan"])]
+    df["topic"] = df["topic"].astype("string").str.strip()
+    df = df[~(df["topic"].isna() | df["topic"].isin(["-1", "-1.0", "", "None", "nan"]))]
 else:
     df["topic"] = pd.NA
 
+# 'lugar' y 'topic' como Categorical: agrupaciones y filtros trabajan sobre códigos enteros
+df["lugar"] = df["lugar"].astype("category")
+df["topic"] = df["topic"].astype("category")
+
 # detectar columna de reseñas para la wordcloud
 review_col = detect_review_column(df)
 if review_col:
@@ -147,79 +198,95 @@ else:
 # ---------------------------
 # Agregaciones por 'lugar'
 # ---------------------------
+# filas con etiqueta (antes de la conversión, que vuelve nulas las etiquetas desconocidas)
+df["has_label"] = df["sent_label"].notna().astype(np.int8)
+
+# sentimiento como Categorical con códigos fijos {POS: 0, NEU: 1, NEG: 2}
+df["sent_label"] = pd.Categorical(df["sent_label"], categories=SENT_CATEGORIES)
+codes = df["sent_label"].cat.codes.to_numpy()
+lugar_cat = df["lugar"]
+group_ids = lugar_cat.cat.codes.to_numpy()
+
+# indicadores int8 precalculados: el groupby usa el sum nativo en vez de lambdas por grupo
+df["is_pos"] = (codes == 0).view(np.int8)
+df["is_neu"] = (codes == 1).view(np.int8)
+df["is_neg"] = (codes == 2).view(np.int8)
+
 agg = (
-    df.groupby("lugar")
+    df.groupby("lugar", sort=False, observed=True)
     .agg(
-        mentions=("sent_label", "count"),
-        pos=("sent_label", lambda x: (x.astype(str) == "POS").sum()),
-        neg=("sent_label", lambda x: (x.astype(str) == "NEG").sum()),
-        neu=("sent_label", lambda x: (x.astype(str) == "NEU").sum()),
+        mentions=("has_label", "sum"),
+        pos=("is_pos", "sum"),
+        neg=("is_neg", "sum"),
+        neu=("is_neu", "sum"),
     )
     .reset_index()
 )
 agg["pos_ratio"] = agg["pos"] / agg["mentions"]
-agg = agg.sort_values(["pos_ratio", "mentions"], ascending=[False, False])
 
-# top N y bottom N (foco)
-top = agg.head(N)
-resto = agg[~agg["lugar"].isin(top["lugar"])]
-bottom = resto.sort_values("pos_ratio").head(N)
+# top N y bottom N (foco): selección parcial, sin ordenar todo agg; drop evita repetir lugares del top
+top = agg.nlargest(N, ["pos_ratio", "mentions"])
+bottom = agg.drop(index=top.index).nsmallest(N, "pos_ratio")
 focus = pd.concat([top, bottom], ignore_index=True)
 
 # ---------------------------
 # Treemap de tópicos (solo dentro del foco)
 # ---------------------------
 if df["topic"].notna().any():
-    tmp = df[df["lugar"].isin(focus["lugar"])]
-    treemap_df = tmp.groupby("topic").size().reset_index(name="mentions")
+    # membresía sobre los códigos enteros de 'lugar' en vez de comparar strings
+    focus_codes = lugar_cat.cat.categories.get_indexer(focus["lugar"].to_numpy())
+    tmp = df[np.isin(group_ids, focus_codes)]
+    treemap_df = tmp["topic"].value_counts().rename_axis("topic").reset_index(name="mentions")
     treemap_df = treemap_df[treemap_df["mentions"] >= MIN_TOPIC_MENTIONS].reset_index(drop=True)
-    # enriquecer con descripciones y etiquetas
-    def map_topic_row(row):
-        tid = str(row["topic"]).strip()
-        desc = topic_descriptions.get(tid, topic_descriptions.get(f"neg_{tid}", ""))
-        label = short_label(tid)
-        return pd.Series({"topic_id": tid, "label": label, "description": desc, "mentions": int(row["mentions"])})
-    if not treemap_df.empty:
-        treemap_df = treemap_df.apply(map_topic_row, axis=1)
+    # enriquecer con descripciones y etiquetas (lookup vectorizado contra el dict)
+    topic_id = treemap_df["topic"].astype(str).str.strip()
+    treemap_df = pd.DataFrame({
+        "topic_id": topic_id,
+        "label": "Tópico " + topic_id,
+        "description": (
+            topic_id.map(topic_descriptions)
+            .fillna(("neg_" + topic_id).map(topic_descriptions))
+            .fillna("")
+        ),
+        "mentions": treemap_df["mentions"].astype("int64"),
+    })
 else:
     treemap_df = pd.DataFrame(columns=["topic_id", "label", "description", "mentions"])
 
 # ---------------------------
 # Wordcloud (base64)
 # ---------------------------
+def term_frequencies(text_series: pd.Series, max_terms: int = WC_MAX_WORDS, min_len: int = 1) -> Dict[str, int]:
+    # el texto ya viene lematizado: contamos tokens con value_counts en vez de unir un string gigante
+    tokens = text_series.dropna().astype(str).str.split().explode().dropna()
+    if min_len > 1:
+        tokens = tokens[tokens.str.len() >= min_len]
+    return tokens.value_counts().head(max_terms).to_dict()
+
+
 def make_wordcloud_base64(text_series: pd.Series, colormap="viridis"):
-    text = " ".join(text_series.dropna().astype(str))
-    if not text.strip() and df["topic"].notna().any():
-        text = " ".join(df["topic"].dropna().astype(str))
-    if not text.strip():
+    freqs = term_frequencies(text_series, min_len=3)
+    if not freqs and df["topic"].notna().any():
+        freqs = term_frequencies(df["topic"])
+    if not freqs:
         return None
-    wc = WordCloud(width=1200, height=600, background_color="white", colormap=colormap).generate(text)
+    wc = WordCloud(
+        width=1200,
+        height=600,
+        background_color="white",
+        colormap=colormap,
+        collocations=False,
+        max_words=WC_MAX_WORDS,
+    ).generate_from_frequencies(freqs)
     buf = io.BytesIO()
-    wc.to_image().save(buf, format="PNG")
-    return f"data:image/png;base64,{base64.b64encode(buf.getvalue()).decode()}"
+    # WebP pesa bastante menos que PNG para una imagen decorativa -> payload base64 más chico
+    wc.to_image().save(buf, format="WEBP", quality=85, method=4)
+    return f"data:image/webp;base64,{base64.b64encode(buf.getvalue()).decode()}"
 
-wordcloud_src = make_wordcloud_base64(df["Review_Lematizada"].fillna("").astype(str), colormap="viridis")
 
 # ---------------------------
 # Figuras: barras de sentimiento (stacked) y treemap
 # ---------------------------
-# Preparar datos para gráfico de sentimiento
-# Preparar datos para gráfico de sentimiento divergente
-s = focus.copy()
-s["pos_pct"] = s["pos"] / s["mentions"] * 100
-s["neg_pct"] = s["neg"] / s["mentions"] * 100
-s["neu_pct"] = s["neu"] / s["mentions"] * 100
-
-# Marca bottom como negativos para graficar hacia la izquierda
-s.loc[s["lugar"].isin(bottom["lugar"]), ["pos_pct", "neg_pct", "neu_pct"]] *= -1
-
-sent_long = s.melt(
-    id_vars=["lugar"],
-    value_vars=["pos_pct", "neu_pct", "neg_pct"],
-    var_name="sentiment",
-    value_name="pct"
-).replace({"pos_pct": "Positivas", "neg_pct": "Negativas", "neu_pct": "Neutrales"})
-
 # Asegurarnos de que PALETTE es una lista de colores (ej. px.colors.sequential.Viridis)
 PALETTE = px.colors.sequential.Viridis  # deja como está si ya la tenías
 
@@ -236,54 +303,38 @@ else:
 # Mapa por nombre de sentimiento (asegúrate de que coincida con los nombres en tus datos)
 color_map_sent = {"Positivas": palette_for_sent[0], "Neutrales": palette_for_sent[1], "Negativas": palette_for_sent[2]}
 
+
+def stacked_sentiment_bar(frame: pd.DataFrame, title: str) -> go.Figure:
+    # una traza go.Bar por sentimiento, directo de las columnas NumPy (sin pasar por px)
+    fig = go.Figure()
+    y = frame["lugar"].to_numpy()
+    for name, col in zip(SENT_NAMES, ["pos", "neu", "neg"]):
+        x = frame[col].to_numpy()
+        fig.add_trace(go.Bar(
+            x=x,
+            y=y,
+            name=name,
+            orientation="h",
+            marker_color=color_map_sent[name],
+            text=x,
+            texttemplate="%{text}",
+            textposition="inside",
+            hovertemplate=f"sentiment={name}<br>count=%{{x}}<br>lugar=%{{y}}<extra></extra>",
+        ))
+    fig.update_layout(title=title, barmode="stack", legend_title_text="sentiment", yaxis_title="", xaxis_title="Menciones")
+    return fig
+
+
 # ==========================
 # Sentimiento Top N (mejores)
 # ==========================
-sent_top = top.melt(
-    id_vars=["lugar"],
-    value_vars=["pos", "neu", "neg"],
-    var_name="sentiment",
-    value_name="count"
-).replace({"pos": "Positivas", "neu": "Neutrales", "neg": "Negativas"})
-
-fig_sentiment_top = px.bar(
-    sent_top,
-    x="count",
-    y="lugar",
-    color="sentiment",
-    orientation="h",
-    title=f"{N} Lugares Mejor Evaluados",
-    color_discrete_map=color_map_sent,
-    barmode="stack",
-    text="count"
-)
-fig_sentiment_top.update_traces(texttemplate="%{text}", textposition="inside")
-fig_sentiment_top.update_layout(yaxis_title="", xaxis_title="Menciones")
+fig_sentiment_top = stacked_sentiment_bar(top, f"{N} Lugares Mejor Evaluados")
 
 
 # ==========================
 # Sentimiento Bottom N (peores)
 # ==========================
-sent_bottom = bottom.melt(
-    id_vars=["lugar"],
-    value_vars=["pos", "neu", "neg"],
-    var_name="sentiment",
-    value_name="count"
-).replace({"pos": "Positivas", "neu": "Neutrales", "neg": "Negativas"})
-
-fig_sentiment_bottom = px.bar(
-    sent_bottom,
-    x="count",
-    y="lugar",
-    color="sentiment",
-    orientation="h",
-    title=f"{N} Lugares Peor Evaluados",
-    color_discrete_map=color_map_sent,
-    barmode="stack",
-    text="count"
-)
-fig_sentiment_bottom.update_traces(texttemplate="%{text}", textposition="inside")
-fig_sentiment_bottom.update_layout(yaxis_title="", xaxis_title="Menciones")
+fig_sentiment_bottom = stacked_sentiment_bar(bottom, f"{N} Lugares Peor Evaluados")
 
 
 fig_sentiment_top.update_layout(
@@ -338,6 +389,12 @@ else:
         height=200, margin=dict(t=60, b=20, l=20, r=20)
     )
 
+# Las figuras son estáticas (dependen solo del CSV): se serializan una vez y el layout
+# recibe dicts ya convertidos, sin pasar por el encoder de Plotly en cada carga.
+fig_sentiment_top_json = pio.to_json(fig_sentiment_top)
+fig_sentiment_bottom_json = pio.to_json(fig_sentiment_bottom)
+fig_treemap_json = pio.to_json(fig_treemap)
+
 SUMMARY_MD = """
 📌 **Resumen general de reseñas en la CDMX**
 
@@ -374,7 +431,6 @@ En conjunto, las reseñas resaltan a la CDMX como un destino cultural, familiar
 app = dash.Dash(__name__, external_stylesheets=EXTERNAL_STYLESHEETS)
 app.title = "Dashboard CDMX - Reseñas"
 
-total_reviews = len(df_copy)
 avg_pos_pct = agg["pos_ratio"].mean() * 100
 
 app.layout = html.Div([
@@ -405,24 +461,54 @@ app.layout = html.Div([
     html.Div([
         html.H4("Distribución de Sentimientos", className="text-center text-muted"),
         html.Div([
-            html.Div([dcc.Graph(figure=fig_sentiment_top)], className="col-md-6 p-2"),
-            html.Div([dcc.Graph(figure=fig_sentiment_bottom)], className="col-md-6 p-2"),
+            html.Div([dcc.Graph(figure=json.loads(fig_sentiment_top_json))], className="col-md-6 p-2"),
+            html.Div([dcc.Graph(figure=json.loads(fig_sentiment_bottom_json))], className="col-md-6 p-2"),
         ], className="row")
     ]),
 
     html.Hr(),
 
     html.Div([
-        html.Div([dcc.Graph(figure=fig_treemap)], className="col-md-6 p-2"),
+        html.Div([dcc.Graph(figure=json.loads(fig_treemap_json))], className="col-md-6 p-2"),
         html.Div([
             html.Div([
                 dcc.Markdown(SUMMARY_MD, dangerously_allow_html=True),
             ], className="card p-3", style={"maxHeight": "520px", "overflow": "auto", "textAlign": "left"})
         ], className="col-md-6 p-2"),
     ], className="row"),
+
+    html.Hr(),
+
+    html.Div([
+        html.H4("Nube de palabras", className="text-center text-muted"),
+        html.Div(
+            html.Button("Mostrar nube de palabras", id="wc-trigger", n_clicks=0, className="btn btn-outline-secondary"),
+            className="text-center my-2",
+        ),
+        dcc.Loading(html.Img(id="wc-img", style={"width": "100%"})),
+    ]),
     html.Footer(html.Div("Dashboard generado con datos de reseñas en TripAdvisor — CDMX", className="text-center mt-2 mb-4 text-muted"))
 ], className="container-fluid")
 
+
+# la nube de palabras se genera bajo demanda (fuera del arranque); sus datos son fijos,
+# así que se calcula una sola vez por proceso y se reutiliza entre cargas de página
+@lru_cache(maxsize=1)
+def wordcloud_src():
+    return make_wordcloud_base64(df["Review_Lematizada"].fillna("").astype(str), colormap="viridis")
+
+
+@app.callback(
+    Output("wc-img", "src"),
+    Input("wc-trigger", "n_clicks"),
+    prevent_initial_call=True,
+)
+def render_wordcloud(n_clicks):
+    if n_clicks > 1:
+        raise PreventUpdate  # la imagen ya está en la página
+    return wordcloud_src()
+
+
 if __name__ == "__main__":
     app.run(debug=True)
 